@@ -0,0 +1,272 @@
+"""
+Admission control - keeps the database from drowning under traffic spikes
+
+Every request is put into a priority class (cheap lookups, writes, heavy scans).
+Each class has its own concurrency limit and a bounded wait queue, and all
+classes share one pool of database slots that is handed out by priority.
+Requests that can't get a slot before their deadline get a fast 503 with
+Retry-After instead of piling up behind the database.
+"""
+import asyncio
+import math
+import re
+import time
+from collections import deque
+
+from fastapi.responses import JSONResponse
+
+
+class PriorityClass:
+    """
+    Limits for one group of endpoints
+
+    name = label shown in the stats
+    priority = lower number is served first when slots free up
+    max_concurrent = requests of this class running at once
+    max_queue = requests of this class allowed to wait
+    queue_timeout = seconds a request may wait before it is rejected
+    """
+
+    def __init__(self, name, priority, max_concurrent, max_queue, queue_timeout):
+        self.name = name
+        self.priority = priority
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        self.active = 0
+        self.waiting = deque()
+
+        # Counters
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+
+    def snapshot(self):
+        """Current state and counters as a dict"""
+        return {
+            'priority': self.priority,
+            'max_concurrent': self.max_concurrent,
+            'active': self.active,
+            'queued': sum(1 for waiter in self.waiting if not waiter.done()),
+            'max_queue': self.max_queue,
+            'admitted': self.admitted,
+            'rejected_queue_full': self.rejected_queue_full,
+            'rejected_timeout': self.rejected_timeout,
+        }
+
+
+class TokenBucket:
+    """Token bucket rate limit for one client"""
+
+    def __init__(self, rate, burst):
+        """rate = tokens added per second, burst = bucket size"""
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        """
+        Take one token
+        Returns 0 if allowed, otherwise seconds until a token is available
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class Rejected(Exception):
+    """Raised when a request is turned away"""
+
+    def __init__(self, status_code, detail, retry_after):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+    def to_response(self):
+        """Build the error response (same shape as FastAPI's HTTPException)"""
+        return JSONResponse(
+            status_code=self.status_code,
+            content={"detail": self.detail},
+            headers={"Retry-After": str(max(1, math.ceil(self.retry_after)))},
+        )
+
+
+class AdmissionController:
+    """
+    Decides which requests may run now, which wait and which are rejected
+    All state is only touched from the event loop, so no locks are needed
+    """
+
+    # Stop tracking idle clients once this many buckets exist
+    MAX_BUCKETS = 10000
+
+    def __init__(self, max_concurrent, classes, routes, rate_limit=None, rate_burst=None):
+        """
+        max_concurrent = database slots shared by all classes
+        classes = list of PriorityClass
+        routes = list of (method, path regex, class name); unmatched requests skip admission
+        rate_limit = requests per second per client (None disables rate limiting)
+        rate_burst = bucket size per client (defaults to rate_limit, at least 1)
+        """
+        self.max_concurrent = max_concurrent
+        self.active = 0
+        self.classes = {cls.name: cls for cls in classes}
+        self.by_priority = sorted(classes, key=lambda cls: cls.priority)
+        self.routes = [(method, re.compile(pattern), name) for method, pattern, name in routes]
+
+        self.rate_limit = rate_limit
+        # A bucket smaller than one token could never let a request through
+        self.rate_burst = max(1, rate_burst or rate_limit or 0)
+        self.buckets = {}
+        self.rate_limited = 0
+
+    def classify(self, method, path):
+        """Return the PriorityClass for a request, or None if it isn't limited"""
+        for route_method, pattern, name in self.routes:
+            if route_method == method and pattern.fullmatch(path):
+                return self.classes[name]
+        return None
+
+    def check_rate_limit(self, client):
+        """Raise Rejected (429) if the client is over its rate limit"""
+        if not self.rate_limit:
+            return
+
+        bucket = self.buckets.get(client)
+        if bucket is None:
+            if len(self.buckets) >= self.MAX_BUCKETS:
+                self._prune_buckets()
+            bucket = self.buckets[client] = TokenBucket(self.rate_limit, self.rate_burst)
+
+        wait = bucket.take()
+        if wait:
+            self.rate_limited += 1
+            raise Rejected(429, "Rate limit exceeded", wait)
+
+    async def acquire(self, cls):
+        """Wait for a slot for this class, or raise Rejected (503)"""
+        # Run straight away if there is room and nobody more important is waiting
+        if self._has_room(cls) and not self._anyone_waiting(cls.priority):
+            self._grant(cls)
+            return
+
+        queued = sum(1 for waiter in cls.waiting if not waiter.done())
+        if queued >= cls.max_queue:
+            cls.rejected_queue_full += 1
+            raise Rejected(503, f"Server busy ({cls.name} queue full)", cls.queue_timeout)
+
+        waiter = asyncio.get_running_loop().create_future()
+        cls.waiting.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout=cls.queue_timeout)
+        except asyncio.TimeoutError:
+            # The slot may have been granted just as the deadline passed
+            if waiter.done() and not waiter.cancelled():
+                return
+            cls.rejected_timeout += 1
+            raise Rejected(503, f"Server busy ({cls.name} wait timed out)", cls.queue_timeout)
+        except asyncio.CancelledError:
+            # Client went away - hand the slot back if we already got one
+            if waiter.done() and not waiter.cancelled():
+                self.release(cls)
+            raise
+
+    def release(self, cls):
+        """Give a slot back and wake up the next waiters"""
+        cls.active -= 1
+        self.active -= 1
+        self._dispatch()
+
+    def snapshot(self):
+        """Queue depths and counters for every class"""
+        return {
+            'max_concurrent': self.max_concurrent,
+            'active': self.active,
+            'queued': sum(cls.snapshot()['queued'] for cls in self.by_priority),
+            'rate_limited': self.rate_limited,
+            'classes': {cls.name: cls.snapshot() for cls in self.by_priority},
+        }
+
+    def _has_room(self, cls):
+        """True if both the class and the shared pool have a free slot"""
+        return cls.active < cls.max_concurrent and self.active < self.max_concurrent
+
+    def _anyone_waiting(self, priority):
+        """True if a request of this priority or higher is already queued"""
+        for cls in self.by_priority:
+            if cls.priority > priority:
+                break
+            if any(not waiter.done() for waiter in cls.waiting):
+                return True
+        return False
+
+    def _grant(self, cls):
+        """Take a slot"""
+        cls.active += 1
+        cls.admitted += 1
+        self.active += 1
+
+    def _dispatch(self):
+        """Hand free slots to waiters, most important class first"""
+        for cls in self.by_priority:
+            while cls.waiting and self._has_room(cls):
+                waiter = cls.waiting.popleft()
+                # Skip waiters that already timed out or disconnected
+                if waiter.done():
+                    continue
+                self._grant(cls)
+                waiter.set_result(True)
+            if self.active >= self.max_concurrent:
+                return
+
+    def _prune_buckets(self):
+        """Forget clients whose buckets have refilled (they lose nothing)"""
+        now = time.monotonic()
+        self.buckets = {
+            client: bucket for client, bucket in self.buckets.items()
+            if bucket.tokens + (now - bucket.updated) * bucket.rate < bucket.burst
+        }
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware that runs every request through an AdmissionController
+
+    Written as plain ASGI (not @app.middleware) so the endpoint gets the
+    original receive channel and can still notice client disconnects
+    """
+
+    def __init__(self, app, controller):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        cls = self.controller.classify(scope['method'], scope['path'])
+        if cls is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            client = scope['client'][0] if scope.get('client') else 'unknown'
+            self.controller.check_rate_limit(client)
+            await self.controller.acquire(cls)
+        except Rejected as e:
+            await e.to_response()(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(cls)
@@ -2,32 +2,111 @@
 Database Manager - Complete version for FastAPI
 """
 import os
-import psycopg2
+import threading
+import time
+from psycopg2 import errors
 from psycopg2.extras import RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool
 from dotenv import load_dotenv
 
 load_dotenv()
 
 
+# Case-insensitive keyword match used by every search query
+# (%(pattern)s is "%keyword%": anything + keyword + anything)
+SEARCH_FILTER = """
+    d.source ILIKE %(pattern)s
+    OR d.category ILIKE %(pattern)s
+    OR d.content ILIKE %(pattern)s
+"""
+
+
+class QueryTimeout(Exception):
+    """Raised when a query runs past its statement_timeout"""
+
+
+class QueryCancelled(Exception):
+    """Raised when a query is cancelled (e.g. the client disconnected)"""
+
+
+class QueryControl:
+    """
+    Deadline and cancel handle for one request's queries
+    Pass it to execute_query(); call cancel() from any thread to stop
+    the query that is currently running on the server
+    """
+
+    def __init__(self, timeout=None):
+        """timeout = seconds all queries together may take (None means no limit)"""
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        self.cancelled = False
+        self.conn = None
+        self.lock = threading.Lock()
+
+    def remaining(self):
+        """Seconds left before the deadline (None means no limit)"""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    def attach(self, conn):
+        """Remember the connection running our query"""
+        with self.lock:
+            if self.cancelled:
+                raise QueryCancelled("Query cancelled before it started")
+            self.conn = conn
+
+    def raise_if_cancelled(self):
+        """
+        Raise QueryCancelled if cancel() was already called
+        PostgreSQL only cancels a statement that is running, so a cancel
+        that lands before the statement starts has to be caught here
+        """
+        with self.lock:
+            if self.cancelled:
+                raise QueryCancelled("Query cancelled before it started")
+
+    def detach(self):
+        """Forget the connection before it goes back to the pool"""
+        with self.lock:
+            self.conn = None
+
+    def cancel(self):
+        """Ask PostgreSQL to stop the running query (safe from any thread)"""
+        with self.lock:
+            self.cancelled = True
+            if self.conn is not None:
+                self.conn.cancel()
+
+
 class DatabaseManager:
     """Handles all database operations"""
     
     def __init__(self):
         """Initialize connection variables"""
-        self.conn = None
-        self.cur = None
+        self.pool = None
+        self.slots = None
 
     def connect(self):
-        """Connect to PostgreSQL database"""
+        """
+        Open a pool of connections to PostgreSQL
+        Each query borrows its own connection, so one query can be
+        cancelled without touching the others
+        """
         try:
-            self.conn = psycopg2.connect(
+            size = int(os.getenv('DB_MAX_CONCURRENT', '8'))
+            self.pool = ThreadedConnectionPool(
+                minconn=1,
+                maxconn=size,
                 host=os.getenv('DB_HOST'),
                 port=os.getenv('DB_PORT'),
                 database=os.getenv('DB_NAME'),
                 user=os.getenv('DB_USER'),
                 password=os.getenv('DB_PASSWORD')
             )
-            self.cur = self.conn.cursor(cursor_factory=RealDictCursor)
+            # ThreadedConnectionPool raises when it runs out instead of waiting,
+            # so callers take a slot first and wait here for a free connection
+            self.slots = threading.BoundedSemaphore(size)
             print("✅ Database connected")
             return True
         except Exception as e:
@@ -35,59 +114,202 @@ class DatabaseManager:
             return False
 
     def disconnect(self):
-        """Close database connection"""
-        if self.cur:
-            self.cur.close()
-        if self.conn:
-            self.conn.close()
+        """Close all database connections"""
+        if self.pool:
+            self.pool.closeall()
         print("🔌 Database disconnected")
 
-    def execute_query(self, query, params=None):
+    def _getconn(self, control=None):
+        """Borrow a connection, waiting (up to the control's deadline) if all are busy"""
+        timeout = control.remaining() if control else None
+        if timeout is not None and timeout <= 0:
+            raise QueryTimeout("Request deadline passed before the query started")
+        if not self.slots.acquire(timeout=timeout):
+            raise QueryTimeout("Timed out waiting for a database connection")
+
+        try:
+            return self.pool.getconn()
+        except Exception:
+            self.slots.release()
+            raise
+
+    def _putconn(self, conn):
+        """Return a connection to the pool (broken ones are closed instead of reused)"""
+        try:
+            self.pool.putconn(conn, close=bool(conn.closed))
+        finally:
+            self.slots.release()
+
+    def execute_query(self, query, params=None, control=None):
         """
         Execute any SQL query and return results
         Handles both SELECT and INSERT/UPDATE/DELETE with RETURNING
+
+        control = optional QueryControl for statement_timeout and cancelling
+        Raises QueryTimeout / QueryCancelled when the query is stopped
         """
+        conn = self._getconn(control)
         try:
-            self.cur.execute(query, params)
-            
-            # Check if query modifies data (INSERT, UPDATE, DELETE)
-            query_upper = query.strip().upper()
-            if query_upper.startswith(('INSERT', 'UPDATE', 'DELETE')):
-                self.conn.commit()  # Save changes to database
+            timeout = None
+            if control:
+                control.attach(conn)
+                timeout = control.remaining()
+                if timeout is not None and timeout <= 0:
+                    raise QueryTimeout("Request deadline passed before the query started")
+
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                # Use whatever is left of the request's budget
+                # SET LOCAL only lasts until the end of this transaction
+                if timeout is not None:
+                    timeout_ms = max(1, int(timeout * 1000))
+                    cur.execute("SET LOCAL statement_timeout = %s;", (timeout_ms,))
+
+                if control:
+                    control.raise_if_cancelled()
+                cur.execute(query, params)
+
+                # Return results if query returns rows
+                results = cur.fetchall() if cur.description else None
+
+            # End the transaction so the connection goes back to the pool clean
+            conn.commit()
+            if query.strip().upper().startswith(('INSERT', 'UPDATE', 'DELETE')):
                 print("✅ Changes committed to database")
-            
-            # Return results if query returns rows
-            if self.cur.description:
-                results = self.cur.fetchall()
-                return results
-            
-            return None
-            
+
+            return results
+
+        except errors.QueryCanceled as e:
+            conn.rollback()  # Connection is usable again after rollback
+            if control and control.cancelled:
+                print("🛑 Query cancelled")
+                raise QueryCancelled(str(e))
+            print(f"⏱️  Query timed out: {e}")
+            raise QueryTimeout(str(e))
+
+        except (QueryTimeout, QueryCancelled):
+            raise
+
         except Exception as e:
             print(f"❌ Query error: {e}")
-            if self.conn:
-                self.conn.rollback()  # Undo changes on error
+            if not conn.closed:
+                conn.rollback()  # Undo changes on error
             raise e  # Re-raise so FastAPI can catch it
 
-    def get_all_datasets(self):
+        finally:
+            if control:
+                control.detach()
+            self._putconn(conn)
+
+    def get_all_datasets(self, control=None):
         """Get all datasets ordered by quality score"""
         query = """
         SELECT id, source, category, quality_score, word_count
         FROM datasets
         ORDER BY quality_score DESC;
         """
-        return self.execute_query(query)
+        return self.execute_query(query, control=control)
+
+    def get_facet_counts(self, control=None):
+        """
+        Get unfiltered category, tag and quality_score counts
+        All three histograms come back from a single query
+        """
+        query = """
+        SELECT 'category' AS facet, category AS value, COUNT(*) AS count
+        FROM datasets
+        GROUP BY category
+        UNION ALL
+        SELECT 'quality_score' AS facet, quality_score::text AS value, COUNT(*) AS count
+        FROM datasets
+        WHERE quality_score IS NOT NULL
+        GROUP BY quality_score
+        UNION ALL
+        SELECT 'tag' AS facet, t.name AS value, COUNT(*) AS count
+        FROM dataset_tags dt
+        JOIN tags t ON t.id = dt.tag_id
+        GROUP BY t.name;
+        """
+        return self.execute_query(query, control=control)
+
+    def search_datasets(self, search_pattern, control=None):
+        """
+        Get datasets whose source, category or content match the pattern
+        search_pattern = ILIKE pattern, e.g. "%python%"
+        """
+        query = f"""
+        SELECT d.id, d.content, d.source, d.category, d.quality_score, d.word_count
+        FROM datasets d
+        WHERE {SEARCH_FILTER}
+        ORDER BY d.quality_score DESC;
+        """
+        return self.execute_query(query, {'pattern': search_pattern}, control=control)
+
+    def get_search_tag_counts(self, search_pattern, control=None):
+        """
+        Count tags of the datasets matching a search
+        Uses the same filter as search_datasets(), so the ids never leave the database
+        """
+        query = f"""
+        SELECT t.name, COUNT(*) AS count
+        FROM datasets d
+        JOIN dataset_tags dt ON dt.dataset_id = d.id
+        JOIN tags t ON t.id = dt.tag_id
+        WHERE {SEARCH_FILTER}
+        GROUP BY t.name;
+        """
+        results = self.execute_query(query, {'pattern': search_pattern}, control=control)
+        return {row['name']: row['count'] for row in results or []}
+
+    def get_datasets_after(self, last_id, limit, settle_seconds=0):
+        """
+        Get full datasets (content, metadata and tags) with id above last_id
+        Ordered by id so callers can page through with the last id they saw
+
+        Ids are handed out when a row is inserted, not when it commits, so a
+        lower id can show up after a higher one. Rows are only returned up to
+        the first row created in the last settle_seconds, which gives open
+        transactions that long to commit. A transaction that stays open
+        longer than that can still be skipped.
+        """
+        query = """
+        SELECT
+            d.id,
+            d.content,
+            d.source,
+            d.category,
+            d.quality_score,
+            d.word_count,
+            d.created_at,
+            COALESCE(
+                ARRAY_AGG(t.name ORDER BY t.name) FILTER (WHERE t.name IS NOT NULL),
+                '{}'
+            ) AS tags
+        FROM datasets d
+        LEFT JOIN dataset_tags dt ON d.id = dt.dataset_id
+        LEFT JOIN tags t ON dt.tag_id = t.id
+        WHERE d.id > %s
+            AND d.id < COALESCE(
+                (SELECT MIN(id) FROM datasets
+                 WHERE id > %s
+                   AND created_at >= NOW() - make_interval(secs => %s)),
+                9223372036854775807
+            )
+        GROUP BY d.id
+        ORDER BY d.id
+        LIMIT %s;
+        """
+        return self.execute_query(query, (last_id, last_id, settle_seconds, limit))
 
-    def get_statistics(self):
+    def get_statistics(self, control=None):
         """Get database statistics"""
         stats = {}
         
         # Total datasets
-        result = self.execute_query("SELECT COUNT(*) as count FROM datasets;")
+        result = self.execute_query("SELECT COUNT(*) as count FROM datasets;", control=control)
         stats['total_datasets'] = result[0]['count'] if result else 0
         
         # Total tags
-        result = self.execute_query("SELECT COUNT(*) as count FROM tags;")
+        result = self.execute_query("SELECT COUNT(*) as count FROM tags;", control=control)
         stats['total_tags'] = result[0]['count'] if result else 0
         
         return stats
\ No newline at end of file
@@ -0,0 +1,120 @@
+"""
+Request deadlines - stop database work nobody is waiting for
+
+Every endpoint has a time budget. The budget starts when the request
+arrives (time spent in the admission queue counts), clients can ask for
+less with the X-Request-Timeout header, and whatever is left becomes the
+query's statement_timeout. While the query runs we watch the client
+connection and cancel the query on the server if the client goes away.
+"""
+import asyncio
+import time
+from functools import partial
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from api.db_manager import QueryCancelled, QueryControl, QueryTimeout
+
+# Clients can send a shorter deadline (in seconds) with this header
+REQUEST_TIMEOUT_HEADER = 'X-Request-Timeout'
+
+# How often (seconds) to check whether the client is still connected
+DISCONNECT_POLL_INTERVAL = 0.1
+
+# Non-standard status (from nginx) for "client closed request"
+CLIENT_CLOSED_REQUEST = 499
+
+
+class ArrivalMiddleware:
+    """
+    ASGI middleware that records when a request arrived, before any queueing
+    The time is kept in scope['state'], which endpoints read as request.state.
+
+    Written as plain ASGI (not @app.middleware) so the endpoint gets the
+    original receive channel and can still notice client disconnects
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            scope.setdefault('state', {})['arrived_at'] = time.monotonic()
+        await self.app(scope, receive, send)
+
+
+def remaining_budget(request, budget):
+    """
+    Seconds this request may still spend in the database
+
+    budget = the endpoint's own limit in seconds
+    """
+    header = request.headers.get(REQUEST_TIMEOUT_HEADER)
+    if header:
+        try:
+            budget = min(budget, float(header))
+        except ValueError:
+            raise HTTPException(
+                status_code=400,
+                detail=f"{REQUEST_TIMEOUT_HEADER} must be a number of seconds"
+            )
+
+    arrived_at = getattr(request.state, 'arrived_at', None)
+    if arrived_at is not None:
+        budget -= time.monotonic() - arrived_at
+    return budget
+
+
+async def run_query(request, budget, func, *args, **kwargs):
+    """
+    Run a database call in the thread pool within the request's budget
+
+    func is called with control=QueryControl(...) so its queries get a
+    statement_timeout and can be cancelled if the client disconnects.
+    Raises HTTPException 504 on timeout and 499 on disconnect; either way
+    the connection is rolled back and returned to the pool healthy.
+    """
+    timeout = remaining_budget(request, budget)
+    if timeout <= 0:
+        raise HTTPException(status_code=504, detail="Request deadline exceeded")
+
+    control = QueryControl(timeout=timeout)
+    task = asyncio.ensure_future(run_in_threadpool(partial(func, *args, control=control, **kwargs)))
+
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                break
+            if await request.is_disconnected():
+                print("🔌 Client disconnected - cancelling query")
+                # cancel() opens a connection to the server, keep it off the event loop
+                await run_in_threadpool(control.cancel)
+                break
+
+        # Shielded so cancelling this request doesn't abandon the worker thread
+        return await asyncio.shield(task)
+
+    except asyncio.CancelledError:
+        # Don't let the admission slot go until the worker thread has
+        # stopped and handed its connection back to the pool
+        cleanup = asyncio.ensure_future(_cancel_and_wait(task, control))
+        while not cleanup.done():
+            try:
+                await asyncio.shield(cleanup)
+            except asyncio.CancelledError:
+                pass
+        raise
+    except QueryTimeout:
+        raise HTTPException(status_code=504, detail="Query timed out")
+    except QueryCancelled:
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request")
+
+
+async def _cancel_and_wait(task, control):
+    """Cancel the running query and wait for its worker thread to finish"""
+    await run_in_threadpool(control.cancel)
+    await asyncio.wait({task})
+    if not task.cancelled():
+        task.exception()  # Mark the error as seen - nobody is waiting for it
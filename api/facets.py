@@ -0,0 +1,135 @@
+"""
+Facet counts for the read endpoints
+Builds the category, tag and quality_score histograms that
+scripts/show_stats.py prints, so the UI gets them in the same response
+"""
+import threading
+import time
+
+
+# Facets the API knows how to count
+SUPPORTED_FACETS = ('category', 'tag', 'quality_score')
+
+
+def parse_facets(facets):
+    """
+    Turn "?facets=category,tag" into a list of facet names
+    Returns an empty list when no facets were asked for
+    Raises ValueError for unknown facet names
+    """
+    if not facets:
+        return []
+
+    names = []
+    for name in facets.split(','):
+        name = name.strip()
+        if not name:
+            continue
+        if name not in SUPPORTED_FACETS:
+            raise ValueError(
+                f"Unknown facet '{name}'. Supported facets: {', '.join(SUPPORTED_FACETS)}"
+            )
+        if name not in names:
+            names.append(name)
+    return names
+
+
+def sort_counts(counts):
+    """Order a {value: count} dict by count (highest first), then value"""
+    return dict(sorted(counts.items(), key=lambda item: (-item[1], item[0])))
+
+
+def count_facets(rows, names, tag_counts=None):
+    """
+    Count facets for an already filtered result set in a single pass
+
+    rows = dataset rows (dicts with category and quality_score)
+    names = facet names from parse_facets()
+    tag_counts = {tag: count} for the same rows (tags live in another table)
+    """
+    counts = {name: {} for name in names}
+
+    for row in rows:
+        if 'category' in counts:
+            key = row['category']
+            counts['category'][key] = counts['category'].get(key, 0) + 1
+        if 'quality_score' in counts and row['quality_score'] is not None:
+            key = str(row['quality_score'])
+            counts['quality_score'][key] = counts['quality_score'].get(key, 0) + 1
+
+    if 'tag' in counts:
+        counts['tag'] = dict(tag_counts or {})
+
+    return {name: sort_counts(values) for name, values in counts.items()}
+
+
+class FacetCache:
+    """
+    Keeps unfiltered facet counts in memory
+
+    Loaded from the database in one query and updated when the API creates
+    a dataset. Writes that skip the API (scripts/add_dataset.py, tag links,
+    other uvicorn workers) aren't seen here, so the counts also expire
+    after ttl seconds and are reloaded on the next read.
+    """
+
+    def __init__(self, db, ttl=60):
+        """
+        db = DatabaseManager used to load the counts
+        ttl = seconds before cached counts are reloaded from the database
+        """
+        self.db = db
+        self.ttl = ttl
+        self.counts = None
+        self.loaded_at = 0
+        # Bumped on every write - tells a load whether a write raced with it
+        self.version = 0
+        # Only guards the in-memory dict, never held during a database query
+        self.lock = threading.Lock()
+
+    def get(self, names, control=None):
+        """
+        Return cached counts for the requested facet names
+        control = QueryControl used if the counts have to be loaded first
+        """
+        with self.lock:
+            if self.counts is not None and time.monotonic() - self.loaded_at < self.ttl:
+                return self._select(self.counts, names)
+            version = self.version
+
+        counts = self._load(control)
+
+        with self.lock:
+            # A write during the load may or may not be in our snapshot,
+            # so only keep the snapshot if nothing was written meanwhile
+            if self.version == version:
+                self.counts = counts
+                self.loaded_at = time.monotonic()
+        return self._select(counts, names)
+
+    def add_dataset(self, category, quality_score):
+        """Count a newly created dataset (new datasets have no tags yet)"""
+        with self.lock:
+            self.version += 1
+            # Nothing loaded yet - the next read will pick up the new row
+            if self.counts is None:
+                return
+            self._increment('category', category)
+            if quality_score is not None:
+                self._increment('quality_score', str(quality_score))
+
+    def _load(self, control=None):
+        """Load all facet counts from the database in one round trip"""
+        counts = {name: {} for name in SUPPORTED_FACETS}
+        for row in self.db.get_facet_counts(control=control) or []:
+            counts[row['facet']][row['value']] = row['count']
+        return counts
+
+    @staticmethod
+    def _select(counts, names):
+        """Sorted copies of the requested facets"""
+        return {name: sort_counts(counts[name]) for name in names}
+
+    def _increment(self, facet, value):
+        """Add one to a single facet value"""
+        self.counts[facet][value] = self.counts[facet].get(value, 0) + 1
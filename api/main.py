@@ -1,5 +1,10 @@
-from fastapi import FastAPI, HTTPException
+import os
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Request
+from api.admission import AdmissionController, AdmissionMiddleware, PriorityClass
 from api.db_manager import DatabaseManager
+from api.deadlines import ArrivalMiddleware, run_query
+from api.facets import FacetCache, count_facets, parse_facets
 from pydantic import BaseModel, Field
 
 app = FastAPI(
@@ -10,6 +15,45 @@ app = FastAPI(
 
 db = DatabaseManager()
 
+# Unfiltered facet counts, updated on API writes and reloaded after a TTL
+facet_cache = FacetCache(db, ttl=float(os.getenv('FACET_CACHE_TTL_SECONDS', '60')))
+
+# Admission control in front of the database
+# Cheap id lookups are served first, heavy scans queue behind them
+admission = AdmissionController(
+    max_concurrent=int(os.getenv('DB_MAX_CONCURRENT', '8')),
+    classes=[
+        # name, priority, max concurrent, max queue, queue timeout (seconds)
+        PriorityClass('lookup', 0, 8, 100, 1.0),
+        PriorityClass('write', 1, 4, 50, 2.0),
+        PriorityClass('scan', 2, 4, 20, 2.0),
+    ],
+    routes=[
+        ('GET', r'/datasets/\d+', 'lookup'),
+        ('POST', r'/datasets', 'write'),
+        ('GET', r'/datasets', 'scan'),
+        ('GET', r'/search', 'scan'),
+        ('GET', r'/stats', 'scan'),
+    ],
+    # Per-client rate limit (requests per second), off unless set
+    rate_limit=float(os.getenv('RATE_LIMIT_PER_SECOND', '0')) or None,
+    rate_burst=float(os.getenv('RATE_LIMIT_BURST', '0')) or None,
+)
+
+
+# Seconds each kind of request may spend in the database
+# (clients can ask for less with the X-Request-Timeout header)
+LOOKUP_BUDGET = float(os.getenv('LOOKUP_BUDGET_SECONDS', '2'))
+WRITE_BUDGET = float(os.getenv('WRITE_BUDGET_SECONDS', '5'))
+SCAN_BUDGET = float(os.getenv('SCAN_BUDGET_SECONDS', '10'))
+
+
+app.add_middleware(AdmissionMiddleware, controller=admission)
+
+# Added last so it runs first - queue time counts against the budget
+app.add_middleware(ArrivalMiddleware)
+
+
 class DatasetCreate(BaseModel):
     """
     Model for creating a new dataset
@@ -39,31 +83,73 @@ def read_root():
 
 
 @app.get("/datasets")
-def get_all_datasets():
+async def get_all_datasets(request: Request, facets: Optional[str] = None):
+    """
+    Get all datasets
+
+    Args:
+        facets (str): Optional comma separated facets to count
+                      (category, tag, quality_score)
+
+    Returns:
+        dict: All datasets, plus facet counts when asked for
+    """
     try:
-        datasets = db.get_all_datasets()
-        return {
+        facet_names = parse_facets(facets)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        datasets = await run_query(request, SCAN_BUDGET, db.get_all_datasets)
+        response = {
             "success": True,
             "count": len(datasets) if datasets else 0,
             "data": datasets if datasets else []
         }
+
+        # No filter here, so the cached unfiltered counts apply
+        # (they can lag writes made outside the API by up to the cache TTL)
+        if facet_names:
+            response["facets"] = await run_query(
+                request, SCAN_BUDGET, facet_cache.get, facet_names
+            )
+
+        return response
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/admission")
+def get_admission_stats():
+    """
+    Admission control state
+
+    Returns:
+        dict: Active requests, queue depths and rejection counters per class
+    """
+    return {
+        "success": True,
+        "data": admission.snapshot()
+    }
+
+
 @app.get("/stats")
-def get_stats():
+async def get_stats(request: Request):
     try:
-        stats = db.get_statistics()
+        stats = await run_query(request, SCAN_BUDGET, db.get_statistics)
         return {
             "success": True,
             "data": stats
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/datasets/{dataset_id}")  
-def get_dataset_by_id(dataset_id: int):
+async def get_dataset_by_id(request: Request, dataset_id: int):
     """
     Get a single dataset by ID
     
@@ -80,7 +166,9 @@ def get_dataset_by_id(dataset_id: int):
         FROM datasets
         WHERE id = %s;
         """
-        result = db.execute_query(query, (dataset_id,))
+        result = await run_query(
+            request, LOOKUP_BUDGET, db.execute_query, query, (dataset_id,)
+        )
         
         # Check if dataset exists
         if not result or len(result) == 0:
@@ -104,7 +192,7 @@ def get_dataset_by_id(dataset_id: int):
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.post("/datasets")
-def create_dataset(dataset: DatasetCreate):
+async def create_dataset(request: Request, dataset: DatasetCreate):
     """
     Create a new dataset
     
@@ -123,7 +211,10 @@ def create_dataset(dataset: DatasetCreate):
         """
         
         # Execute the insert query with parameters as a tuple
-        result = db.execute_query(
+        result = await run_query(
+            request,
+            WRITE_BUDGET,
+            db.execute_query,
             query,
             (
                 dataset.content,
@@ -142,6 +233,9 @@ def create_dataset(dataset: DatasetCreate):
             )
         
         new_id = result[0]['id']
+
+        # Keep cached facet counts in sync without re-running GROUP BY
+        facet_cache.add_dataset(dataset.category, dataset.quality_score)
         
         # Return success response
         return {
@@ -168,48 +262,57 @@ def create_dataset(dataset: DatasetCreate):
         )  
     
 @app.get("/search")
-def search_datasets(q: str):
+async def search_datasets(request: Request, q: str, facets: Optional[str] = None):
     """
     Search datasets by keyword
     
     Args:
         q (str): Search keyword (searches in source, category, and content)
+        facets (str): Optional comma separated facets to count for the matches
+                      (category, tag, quality_score)
         
     Returns:
-        dict: List of matching datasets
+        dict: List of matching datasets, plus facet counts when asked for
         
     Example:
         /search?q=python → Finds datasets with "python" in name/content
+        /search?q=python&facets=category,tag → Same, with category and tag counts
     """
     try:
-        # SQL query with ILIKE for case-insensitive search
-        # %{keyword}% means: anything + keyword + anything
-        query = """
-        SELECT id, content, source, category, quality_score, word_count
-        FROM datasets
-        WHERE source ILIKE %s
-            OR category ILIKE %s
-            OR content ILIKE %s
-        ORDER BY quality_score DESC;
-        """
-        
+        facet_names = parse_facets(facets)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
         # Create search pattern: %keyword%
         search_pattern = f"%{q}%"
         
-        # Execute query (same pattern for all 3 fields)
-        results = db.execute_query(
-            query,
-            (search_pattern, search_pattern, search_pattern)
-        )
+        # Case-insensitive search in source, category and content
+        results = await run_query(request, SCAN_BUDGET, db.search_datasets, search_pattern)
         
-        # Return results
-        return {
+        results = results if results else []
+        response = {
             "success": True,
             "query": q,
-            "count": len(results) if results else 0,
-            "data": results if results else []
+            "count": len(results),
+            "data": results
         }
+
+        # Count facets over the matching rows in one pass
+        # Tags live in dataset_tags, so they are counted by one query with the same filter
+        if facet_names:
+            tag_counts = None
+            if 'tag' in facet_names:
+                tag_counts = await run_query(
+                    request, SCAN_BUDGET, db.get_search_tag_counts, search_pattern
+                )
+            response["facets"] = count_facets(results, facet_names, tag_counts)
+
+        # Return results
+        return response
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -0,0 +1,32 @@
+"""
+Write binary shards for training loaders
+Only datasets added since the last run are appended
+
+Usage:
+    python scripts/write_shards.py [output_dir] [shard_size_mb]
+"""
+import os
+import sys
+
+# Allow running as "python scripts/write_shards.py" from the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.db_manager import DatabaseManager
+from shards import ShardWriter
+from shards.format import DEFAULT_SHARD_SIZE
+
+output_dir = sys.argv[1] if len(sys.argv) > 1 else 'data/shards'
+shard_size = int(sys.argv[2]) * 1024 * 1024 if len(sys.argv) > 2 else DEFAULT_SHARD_SIZE
+
+db = DatabaseManager()
+if not db.connect():
+    sys.exit(1)
+
+try:
+    writer = ShardWriter(db, output_dir, shard_size=shard_size)
+    written = writer.write()
+    print(f"✅ Added {written} datasets to {output_dir}")
+    print(f"📊 Total records: {writer.manifest['total_records']}")
+    print(f"🗂️  Shards: {len(writer.manifest['shards'])}")
+finally:
+    db.disconnect()
@@ -0,0 +1,9 @@
+"""
+Binary shard format for training loaders
+Dump datasets once with scripts/write_shards.py, then read them
+with ShardReader from any number of epochs and worker processes
+"""
+from shards.reader import ShardReader
+from shards.writer import ShardWriter
+
+__all__ = ['ShardReader', 'ShardWriter']
@@ -0,0 +1,79 @@
+"""
+Shard file layout - shared by the writer and the reader
+
+A shard directory holds:
+    manifest.json       list of shards and the last dataset id written
+    shard-00000.bin     records, one after another
+    shard-00000.idx     fixed width index: (dataset id, record offset) per record
+
+Each record in a .bin file is:
+    header   dataset id, content length, metadata length
+    content  UTF-8 text
+    metadata UTF-8 JSON (source, category, quality_score, word_count, created_at, tags)
+"""
+import json
+import os
+import struct
+
+FORMAT_VERSION = 1
+
+MANIFEST_NAME = 'manifest.json'
+
+# Little endian: id (u64), content length (u32), metadata length (u32)
+RECORD_HEADER = struct.Struct('<QII')
+
+# Little endian: id (u64), offset of the record in the .bin file (u64)
+INDEX_ENTRY = struct.Struct('<QQ')
+
+# Shards stop growing once they reach this size (records are never split)
+DEFAULT_SHARD_SIZE = 64 * 1024 * 1024
+
+
+def shard_paths(directory, shard_number):
+    """Return the (.bin, .idx) paths for one shard"""
+    name = f"shard-{shard_number:05d}"
+    return (
+        os.path.join(directory, name + '.bin'),
+        os.path.join(directory, name + '.idx'),
+    )
+
+
+def empty_manifest(shard_size=DEFAULT_SHARD_SIZE):
+    """Manifest for a directory with nothing written yet"""
+    return {
+        'version': FORMAT_VERSION,
+        'shard_size': shard_size,
+        'last_id': 0,
+        'total_records': 0,
+        'shards': [],
+    }
+
+
+def read_manifest(directory):
+    """Load manifest.json, or None if the directory has no shards yet"""
+    path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    if manifest.get('version') != FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported shard format version {manifest.get('version')} in {path}"
+        )
+    return manifest
+
+
+def write_manifest(directory, manifest):
+    """
+    Save manifest.json atomically
+    Readers either see the old manifest or the new one, never half of it
+    """
+    path = os.path.join(directory, MANIFEST_NAME)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
@@ -0,0 +1,182 @@
+"""
+Shard Reader
+Memory-maps shards written by ShardWriter for random access from training loaders
+Pages are shared between processes by the OS, so many workers can read
+the same shards without copying them
+"""
+import bisect
+import json
+import mmap
+import random
+
+from shards.format import INDEX_ENTRY, RECORD_HEADER, read_manifest, shard_paths
+
+
+class ShardReader:
+    """
+    Random access over every record in a shard directory
+
+    reader = ShardReader('data/shards')
+    len(reader)                 number of records
+    reader[42]                  record at position 42 (dict)
+    reader.get_by_id(1234)      record for dataset id 1234
+    reader.iterate(shuffle=True, epoch=3, worker_id=0, num_workers=4)
+    """
+
+    def __init__(self, directory):
+        """directory = shard directory containing manifest.json"""
+        self.directory = directory
+        self._open()
+
+    def _open(self, limits=None):
+        """
+        Read the manifest and memory-map every shard
+
+        limits = {shard number: record count} to read exactly that snapshot,
+        even if the writer has appended more since (used by worker processes)
+        """
+        manifest = read_manifest(self.directory)
+        if manifest is None:
+            raise FileNotFoundError(f"No shard manifest found in {self.directory}")
+
+        self.shards = []
+        self.starts = []   # position of each shard's first record
+        total = 0
+        for shard in manifest['shards']:
+            records = shard['records']
+            if limits is not None:
+                records = min(records, limits.get(shard['number'], 0))
+            if records == 0:
+                continue
+            bin_path, idx_path = shard_paths(self.directory, shard['number'])
+            self.shards.append({
+                'number': shard['number'],
+                'records': records,
+                'first_id': shard['first_id'],
+                'data': self._map(bin_path),
+                'index': self._map(idx_path),
+            })
+            self.starts.append(total)
+            total += shard['records']
+
+        # Only count what the manifest recorded - a writer may be appending past it
+        self.total_records = total
+        self.first_ids = [shard['first_id'] for shard in self.shards]
+
+    @staticmethod
+    def _map(path):
+        """Memory-map a file read-only"""
+        with open(path, 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        """Unmap every shard"""
+        for shard in self.shards:
+            shard['data'].close()
+            shard['index'].close()
+        self.shards = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __getstate__(self):
+        """
+        Send the directory and this reader's record counts to worker processes
+        Workers map the files themselves but read the same snapshot, so every
+        worker sees the same records (and the same shuffle) even if the
+        writer appends in between
+        """
+        return {
+            'directory': self.directory,
+            'limits': {shard['number']: shard['records'] for shard in self.shards},
+        }
+
+    def __setstate__(self, state):
+        self.directory = state['directory']
+        self._open(state['limits'])
+
+    def __len__(self):
+        return self.total_records
+
+    def __getitem__(self, position):
+        """Return the record at a position (0 to len - 1) as a dict"""
+        dataset_id, content, metadata = self.get_raw(position)
+        record = json.loads(bytes(metadata))
+        record['id'] = dataset_id
+        record['content'] = str(content, 'utf-8')
+        return record
+
+    def get_raw(self, position):
+        """
+        Return (id, content, metadata) without copying
+        content and metadata are memoryviews into the mapped shard -
+        release them before calling close()
+        """
+        shard, local = self._locate(position)
+        _, offset = INDEX_ENTRY.unpack_from(shard['index'], local * INDEX_ENTRY.size)
+        dataset_id, content_length, metadata_length = RECORD_HEADER.unpack_from(shard['data'], offset)
+
+        start = offset + RECORD_HEADER.size
+        view = memoryview(shard['data'])
+        content = view[start:start + content_length]
+        metadata = view[start + content_length:start + content_length + metadata_length]
+        return dataset_id, content, metadata
+
+    def get_by_id(self, dataset_id):
+        """
+        Return the record for a dataset id, or None if it is not in the shards
+        Ids are written in ascending order, so this is a binary search
+        """
+        shard_number = bisect.bisect_right(self.first_ids, dataset_id) - 1
+        if shard_number < 0:
+            return None
+
+        shard = self.shards[shard_number]
+        low, high = 0, shard['records']
+        while low < high:
+            middle = (low + high) // 2
+            current_id, _ = INDEX_ENTRY.unpack_from(shard['index'], middle * INDEX_ENTRY.size)
+            if current_id < dataset_id:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low == shard['records']:
+            return None
+        current_id, _ = INDEX_ENTRY.unpack_from(shard['index'], low * INDEX_ENTRY.size)
+        if current_id != dataset_id:
+            return None
+        return self[self.starts[shard_number] + low]
+
+    def positions(self, shuffle=False, seed=0, epoch=0, worker_id=0, num_workers=1):
+        """
+        Record positions one worker should read this epoch
+
+        shuffle = shuffle order (same seed + epoch gives the same order in every worker)
+        worker_id / num_workers = split the positions so workers never overlap
+        """
+        if not 0 <= worker_id < num_workers:
+            raise ValueError(f"worker_id must be between 0 and {num_workers - 1}")
+
+        positions = list(range(self.total_records))
+        if shuffle:
+            random.Random(seed + epoch).shuffle(positions)
+        return positions[worker_id::num_workers]
+
+    def iterate(self, shuffle=False, seed=0, epoch=0, worker_id=0, num_workers=1):
+        """Yield records for one worker and one epoch (see positions())"""
+        for position in self.positions(shuffle, seed, epoch, worker_id, num_workers):
+            yield self[position]
+
+    def _locate(self, position):
+        """Find (shard, position inside that shard) for a global position"""
+        if position < 0:
+            position += self.total_records
+        if not 0 <= position < self.total_records:
+            raise IndexError(f"Record {position} out of range (0-{self.total_records - 1})")
+
+        shard_number = bisect.bisect_right(self.starts, position) - 1
+        return self.shards[shard_number], position - self.starts[shard_number]
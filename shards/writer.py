@@ -0,0 +1,169 @@
+"""
+Shard Writer
+Dumps the datasets table (content, metadata and tags) into binary shards
+Incremental: each run only appends datasets with an id above the last one written
+"""
+import json
+import os
+
+from shards.format import (
+    DEFAULT_SHARD_SIZE,
+    INDEX_ENTRY,
+    MANIFEST_NAME,
+    RECORD_HEADER,
+    empty_manifest,
+    read_manifest,
+    shard_paths,
+    write_manifest,
+)
+
+
+def encode_record(row):
+    """Turn one dataset row into the bytes stored in a shard"""
+    content = row['content'].encode('utf-8')
+    metadata = {
+        'source': row['source'],
+        'category': row['category'],
+        'quality_score': row['quality_score'],
+        'word_count': row['word_count'],
+        'created_at': row['created_at'].isoformat() if row.get('created_at') else None,
+        'tags': list(row.get('tags') or []),
+    }
+    metadata = json.dumps(metadata, separators=(',', ':')).encode('utf-8')
+    header = RECORD_HEADER.pack(row['id'], len(content), len(metadata))
+    return header + content + metadata
+
+
+class ShardWriter:
+    """Appends new datasets from the database to a shard directory"""
+
+    def __init__(self, db, directory, shard_size=DEFAULT_SHARD_SIZE, batch_size=1000,
+                 settle_seconds=60):
+        """
+        db = connected DatabaseManager
+        directory = where shards and manifest.json live
+        shard_size = target size of each shard in bytes
+        batch_size = rows fetched from the database per query
+        settle_seconds = skip rows newer than this (see get_datasets_after)
+        """
+        self.db = db
+        self.directory = directory
+        self.shard_size = shard_size
+        self.batch_size = batch_size
+        self.settle_seconds = settle_seconds
+        self.manifest = None
+        self.bin_file = None
+        self.idx_file = None
+
+    def write(self):
+        """
+        Append every dataset newer than the manifest's last_id
+        Returns the number of records written
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self.manifest = read_manifest(self.directory) or empty_manifest(self.shard_size)
+        # Keep the shard size the directory was created with
+        self.shard_size = self.manifest['shard_size']
+
+        self._discard_uncommitted()
+
+        written = 0
+        try:
+            while True:
+                rows = self.db.get_datasets_after(
+                    self.manifest['last_id'], self.batch_size, self.settle_seconds
+                )
+                if not rows:
+                    break
+
+                for row in rows:
+                    self._append(row)
+                written += len(rows)
+
+                # Make the batch durable before the manifest points at it
+                self._sync()
+                write_manifest(self.directory, self.manifest)
+                print(f"📦 Wrote {written} records (last id {self.manifest['last_id']})")
+        finally:
+            self._close()
+
+        if not os.path.exists(os.path.join(self.directory, MANIFEST_NAME)):
+            write_manifest(self.directory, self.manifest)
+        return written
+
+    def _discard_uncommitted(self):
+        """
+        Cut off anything past what the manifest recorded
+        (left behind if a previous run stopped between writing and saving the manifest)
+        """
+        if not self.manifest['shards']:
+            return
+
+        shard = self.manifest['shards'][-1]
+        bin_path, idx_path = shard_paths(self.directory, shard['number'])
+        for path, size in ((bin_path, shard['bytes']),
+                           (idx_path, shard['records'] * INDEX_ENTRY.size)):
+            if os.path.getsize(path) > size:
+                with open(path, 'r+b') as f:
+                    f.truncate(size)
+
+    def _append(self, row):
+        """Add one record to the current shard, starting a new shard when it is full"""
+        record = encode_record(row)
+        shard = self.manifest['shards'][-1] if self.manifest['shards'] else None
+
+        # Start a new shard when the current one would grow past shard_size
+        # (an empty shard always takes the record, even an oversized one)
+        if shard is None or (shard['bytes'] > 0 and shard['bytes'] + len(record) > self.shard_size):
+            shard = self._new_shard()
+        elif self.bin_file is None:
+            self._open(shard, 'ab')
+
+        self.bin_file.write(record)
+        self.idx_file.write(INDEX_ENTRY.pack(row['id'], shard['bytes']))
+
+        if shard['records'] == 0:
+            shard['first_id'] = row['id']
+        shard['last_id'] = row['id']
+        shard['records'] += 1
+        shard['bytes'] += len(record)
+        self.manifest['last_id'] = row['id']
+        self.manifest['total_records'] += 1
+
+    def _new_shard(self):
+        """Close the current shard and start the next one"""
+        if self.bin_file is not None:
+            self._sync()
+            self._close()
+
+        shard = {
+            'number': len(self.manifest['shards']),
+            'records': 0,
+            'bytes': 0,
+            'first_id': None,
+            'last_id': None,
+        }
+        self.manifest['shards'].append(shard)
+        self._open(shard, 'wb')
+        return shard
+
+    def _open(self, shard, mode):
+        """Open the .bin and .idx files of a shard"""
+        bin_path, idx_path = shard_paths(self.directory, shard['number'])
+        self.bin_file = open(bin_path, mode)
+        self.idx_file = open(idx_path, mode)
+
+    def _sync(self):
+        """Flush open shard files to disk"""
+        for f in (self.bin_file, self.idx_file):
+            if f is not None:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _close(self):
+        """Close open shard files"""
+        for f in (self.bin_file, self.idx_file):
+            if f is not None:
+                f.close()
+        self.bin_file = None
+        self.idx_file = None
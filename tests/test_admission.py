@@ -0,0 +1,211 @@
+"""
+Tests for admission control and rate limiting
+Runs the controller directly on an event loop, no server needed
+"""
+import asyncio
+
+import pytest
+
+pytest.importorskip('fastapi')
+
+from api import admission as admission_module
+from api.admission import (
+    AdmissionController,
+    AdmissionMiddleware,
+    PriorityClass,
+    Rejected,
+    TokenBucket,
+)
+
+
+def make_controller(max_concurrent=2, **kwargs):
+    return AdmissionController(
+        max_concurrent=max_concurrent,
+        classes=[
+            PriorityClass('lookup', 0, 2, 5, 0.5),
+            PriorityClass('scan', 1, 2, 1, 0.2),
+        ],
+        routes=[
+            ('GET', r'/datasets/\d+', 'lookup'),
+            ('GET', r'/search', 'scan'),
+        ],
+        **kwargs,
+    )
+
+
+class FakeClock:
+    """Replaces time.monotonic inside the admission module"""
+
+    def __init__(self, monkeypatch):
+        self.now = 1000.0
+        monkeypatch.setattr(admission_module.time, 'monotonic', lambda: self.now)
+
+
+def test_token_bucket_burst_then_refill(monkeypatch):
+    clock = FakeClock(monkeypatch)
+    bucket = TokenBucket(rate=2, burst=3)
+
+    assert [bucket.take() for _ in range(3)] == [0, 0, 0]
+    assert bucket.take() == pytest.approx(0.5)
+
+    clock.now += 0.5
+    assert bucket.take() == 0
+
+
+def test_slow_rate_limit_still_allows_one_request(monkeypatch):
+    clock = FakeClock(monkeypatch)
+    controller = make_controller(rate_limit=0.5)
+
+    controller.check_rate_limit('1.2.3.4')
+    with pytest.raises(Rejected) as rejected:
+        controller.check_rate_limit('1.2.3.4')
+    assert rejected.value.status_code == 429
+
+    clock.now += 2
+    controller.check_rate_limit('1.2.3.4')
+    assert controller.rate_limited == 1
+
+
+def test_classify():
+    controller = make_controller()
+
+    assert controller.classify('GET', '/datasets/7').name == 'lookup'
+    assert controller.classify('GET', '/search').name == 'scan'
+    assert controller.classify('GET', '/datasets') is None
+    assert controller.classify('POST', '/search') is None
+
+
+def test_waiting_lookups_go_before_waiting_scans():
+    controller = make_controller()
+    lookup, scan = controller.classes['lookup'], controller.classes['scan']
+    started = []
+
+    async def job(cls, name):
+        try:
+            await controller.acquire(cls)
+        except Rejected:
+            started.append((name, 'rejected'))
+            return
+        started.append(name)
+        await asyncio.sleep(0.02)
+        controller.release(cls)
+
+    async def main():
+        first = [asyncio.create_task(job(scan, 'scan-1')), asyncio.create_task(job(scan, 'scan-2'))]
+        await asyncio.sleep(0)
+        # Both slots are busy: one scan queues, the lookup queues ahead of it
+        later = [asyncio.create_task(job(scan, 'scan-3')), asyncio.create_task(job(lookup, 'lookup-1'))]
+        await asyncio.gather(*first, *later)
+
+    asyncio.run(main())
+
+    assert started == ['scan-1', 'scan-2', 'lookup-1', 'scan-3']
+    assert controller.active == 0
+
+
+def test_full_queue_is_rejected_with_retry_after():
+    controller = make_controller()
+    scan = controller.classes['scan']
+
+    async def main():
+        await controller.acquire(scan)
+        await controller.acquire(scan)
+        waiting = asyncio.create_task(controller.acquire(scan))
+        await asyncio.sleep(0)
+
+        with pytest.raises(Rejected) as rejected:
+            await controller.acquire(scan)
+
+        controller.release(scan)
+        await waiting
+        return rejected.value
+
+    rejected = asyncio.run(main())
+
+    assert rejected.status_code == 503
+    assert rejected.to_response().headers['Retry-After'] == '1'
+    assert controller.classes['scan'].rejected_queue_full == 1
+
+
+def test_wait_past_deadline_is_rejected():
+    controller = make_controller()
+    scan = controller.classes['scan']
+
+    async def main():
+        await controller.acquire(scan)
+        await controller.acquire(scan)
+        with pytest.raises(Rejected):
+            await controller.acquire(scan)
+
+    asyncio.run(main())
+
+    snapshot = controller.snapshot()
+    assert snapshot['classes']['scan']['rejected_timeout'] == 1
+    assert snapshot['classes']['scan']['queued'] == 0
+    assert snapshot['active'] == 2
+
+
+def run_middleware(controller, path, inner_app):
+    """Send one GET through AdmissionMiddleware, return (sent messages, receive used)"""
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        'type': 'http', 'method': 'GET', 'path': path, 'headers': [],
+        'client': ('1.2.3.4', 5000), 'query_string': b'',
+    }
+    asyncio.run(AdmissionMiddleware(inner_app, controller)(scope, receive, send))
+    return sent, receive
+
+
+def test_middleware_passes_original_receive_and_releases_slot():
+    controller = make_controller()
+    seen = {}
+
+    async def inner_app(scope, receive, send):
+        seen['receive'] = receive
+        seen['active'] = controller.active
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b'ok'})
+
+    sent, receive = run_middleware(controller, '/search', inner_app)
+
+    # The endpoint must get the server's own receive to see disconnects
+    assert seen['receive'] is receive
+    assert seen['active'] == 1
+    assert controller.active == 0
+    assert sent[0]['status'] == 200
+
+
+def test_middleware_rejects_with_retry_after(monkeypatch):
+    FakeClock(monkeypatch)
+    controller = make_controller(rate_limit=1)
+    controller.check_rate_limit('1.2.3.4')
+
+    async def inner_app(scope, receive, send):
+        raise AssertionError("rejected requests must not reach the app")
+
+    sent, _ = run_middleware(controller, '/search', inner_app)
+
+    assert sent[0]['status'] == 429
+    assert (b'retry-after', b'1') in sent[0]['headers']
+    assert controller.active == 0
+
+
+def test_middleware_skips_unlimited_routes():
+    controller = make_controller(rate_limit=1)
+    calls = []
+
+    async def inner_app(scope, receive, send):
+        calls.append(scope['path'])
+
+    run_middleware(controller, '/admission', inner_app)
+    run_middleware(controller, '/admission', inner_app)
+
+    assert calls == ['/admission', '/admission']
+    assert controller.rate_limited == 0
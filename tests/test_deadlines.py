@@ -0,0 +1,204 @@
+"""
+Tests for request deadlines, statement timeouts and cancel on disconnect
+Drives the real app with a fake database, so no PostgreSQL is needed
+"""
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('fastapi')
+pytest.importorskip('psycopg2')
+
+from api import main
+from api.db_manager import DatabaseManager, QueryCancelled, QueryControl, QueryTimeout
+
+
+class FakeConn:
+    """Stands in for a psycopg2 connection running a slow query"""
+
+    def __init__(self):
+        self.cancelled = threading.Event()
+        self.closed = 0
+        self.statements = []
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def cursor(self, cursor_factory=None):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.description = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self.conn.statements.append(query)
+
+    def fetchall(self):
+        return []
+
+
+class FakePool:
+    def __init__(self, conn):
+        self.conn = conn
+        self.returned = 0
+
+    def getconn(self):
+        return self.conn
+
+    def putconn(self, conn, close=False):
+        self.returned += 1
+
+
+def call_app(path, disconnect_after=None, headers=()):
+    """
+    Send one GET through the whole app (middlewares included)
+    disconnect_after = seconds before the client sends http.disconnect
+    Returns (status, body)
+    """
+    sent = []
+
+    async def run():
+        gone = asyncio.Event()
+        if disconnect_after is not None:
+            asyncio.get_running_loop().call_later(disconnect_after, gone.set)
+
+        async def receive():
+            await gone.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        path_only, _, query = path.partition('?')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': 'GET', 'scheme': 'http', 'path': path_only, 'raw_path': path_only.encode(),
+            'root_path': '', 'query_string': query.encode(),
+            'headers': [(name.lower().encode(), value.encode()) for name, value in headers],
+            'client': ('127.0.0.1', 5000), 'server': ('testserver', 80),
+        }
+        await main.app(scope, receive, send)
+
+    asyncio.run(run())
+    start = next(message for message in sent if message['type'] == 'http.response.start')
+    body = b''.join(message.get('body', b'') for message in sent if message['type'] == 'http.response.body')
+    return start['status'], json.loads(body)
+
+
+def slow_search(seconds, log):
+    """Fake DatabaseManager.search_datasets that runs until done or cancelled"""
+    def search_datasets(search_pattern, control=None):
+        conn = FakeConn()
+        control.attach(conn)
+        try:
+            log['started'] = time.monotonic()
+            if conn.cancelled.wait(seconds):
+                log['cancelled'] = time.monotonic()
+                raise QueryCancelled("canceling statement due to user request")
+            return []
+        finally:
+            control.detach()
+    return search_datasets
+
+
+def test_client_disconnect_cancels_query(monkeypatch):
+    log = {}
+    monkeypatch.setattr(main.db, 'search_datasets', slow_search(2.5, log))
+
+    status, body = call_app('/search?q=python', disconnect_after=0.3)
+
+    assert status == 499
+    assert body['detail'] == "Client closed request"
+    assert log['cancelled'] - log['started'] < 1.5
+    assert main.admission.active == 0
+
+
+def test_query_finishes_when_client_stays(monkeypatch):
+    log = {}
+    monkeypatch.setattr(main.db, 'search_datasets', slow_search(0.1, log))
+
+    status, body = call_app('/search?q=python')
+
+    assert status == 200
+    assert body['count'] == 0
+    assert 'cancelled' not in log
+
+
+def test_timeout_returns_504(monkeypatch):
+    def search_datasets(search_pattern, control=None):
+        # Budget is capped by the header, so little time is left
+        assert 0 < control.remaining() <= 0.5
+        raise QueryTimeout("canceling statement due to statement timeout")
+
+    monkeypatch.setattr(main.db, 'search_datasets', search_datasets)
+
+    status, _ = call_app('/search?q=python', headers=[('X-Request-Timeout', '0.5')])
+
+    assert status == 504
+
+
+def test_bad_timeout_header_returns_400(monkeypatch):
+    monkeypatch.setattr(main.db, 'search_datasets', lambda *args, **kwargs: [])
+
+    status, _ = call_app('/search?q=python', headers=[('X-Request-Timeout', 'soon')])
+
+    assert status == 400
+
+
+def make_db(conn):
+    db = DatabaseManager()
+    db.pool = FakePool(conn)
+    db.slots = threading.BoundedSemaphore(1)
+    return db
+
+
+def test_execute_query_sets_statement_timeout():
+    conn = FakeConn()
+    db = make_db(conn)
+
+    db.execute_query("SELECT 1;", control=QueryControl(timeout=5))
+
+    assert conn.statements[0].startswith("SET LOCAL statement_timeout")
+    assert conn.statements[1] == "SELECT 1;"
+    assert db.pool.returned == 1
+
+
+def test_cancel_before_statement_starts_is_not_lost():
+    conn = FakeConn()
+    db = make_db(conn)
+    control = QueryControl(timeout=5)
+
+    # Cancel lands after attach() but before the query runs
+    original_cursor = conn.cursor
+
+    def cursor(cursor_factory=None):
+        control.cancel()
+        return original_cursor(cursor_factory)
+
+    conn.cursor = cursor
+
+    with pytest.raises(QueryCancelled):
+        db.execute_query("SELECT pg_sleep(60);", control=control)
+
+    assert "SELECT pg_sleep(60);" not in conn.statements
+    # The connection and its slot are handed back
+    assert db.pool.returned == 1
+    assert db.slots.acquire(blocking=False)
@@ -0,0 +1,137 @@
+"""
+Tests for facet parsing, counting and the unfiltered facet cache
+Uses a fake database, so no PostgreSQL is needed
+"""
+import pytest
+
+from api import facets as facets_module
+from api.facets import FacetCache, count_facets, parse_facets
+
+
+class FakeDB:
+    """Stands in for DatabaseManager.get_facet_counts"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.loads = 0
+        # Called in the middle of a load, to simulate a write racing it
+        self.during_load = None
+
+    def get_facet_counts(self, control=None):
+        self.loads += 1
+        if self.during_load:
+            self.during_load()
+            self.during_load = None
+        return [dict(row) for row in self.rows]
+
+
+ROWS = [
+    {'facet': 'category', 'value': 'AI/ML', 'count': 5},
+    {'facet': 'category', 'value': 'Science', 'count': 2},
+    {'facet': 'quality_score', 'value': '9', 'count': 4},
+    {'facet': 'tag', 'value': 'python', 'count': 3},
+]
+
+
+class FakeClock:
+    """Replaces time.monotonic inside the facets module"""
+
+    def __init__(self, monkeypatch):
+        self.now = 1000.0
+        monkeypatch.setattr(facets_module.time, 'monotonic', lambda: self.now)
+
+
+def test_parse_facets():
+    assert parse_facets(None) == []
+    assert parse_facets('') == []
+    assert parse_facets('category, tag,,category') == ['category', 'tag']
+
+    with pytest.raises(ValueError):
+        parse_facets('category,colour')
+
+
+def test_count_facets_single_pass():
+    rows = [
+        {'category': 'AI/ML', 'quality_score': 9},
+        {'category': 'Science', 'quality_score': 9},
+        {'category': 'AI/ML', 'quality_score': None},
+    ]
+
+    counts = count_facets(rows, ['category', 'quality_score', 'tag'], {'python': 2, 'nlp': 5})
+
+    assert counts == {
+        'category': {'AI/ML': 2, 'Science': 1},
+        'quality_score': {'9': 2},
+        'tag': {'nlp': 5, 'python': 2},
+    }
+    # Highest count first
+    assert list(counts['tag']) == ['nlp', 'python']
+
+
+def test_count_facets_only_requested():
+    counts = count_facets([{'category': 'AI/ML', 'quality_score': 3}], ['category'])
+
+    assert counts == {'category': {'AI/ML': 1}}
+
+
+def test_cache_loads_once_and_counts_writes(monkeypatch):
+    FakeClock(monkeypatch)
+    db = FakeDB(ROWS)
+    cache = FacetCache(db, ttl=60)
+
+    assert cache.get(['category'])['category'] == {'AI/ML': 5, 'Science': 2}
+
+    cache.add_dataset('Science', 9)
+    counts = cache.get(['category', 'quality_score', 'tag'])
+
+    assert counts == {
+        'category': {'AI/ML': 5, 'Science': 3},
+        'quality_score': {'9': 5},
+        'tag': {'python': 3},
+    }
+    assert db.loads == 1
+
+
+def test_write_before_first_load_is_not_counted_twice(monkeypatch):
+    FakeClock(monkeypatch)
+    db = FakeDB(ROWS)
+    cache = FacetCache(db, ttl=60)
+
+    # The new row is already in the database the first load reads
+    cache.add_dataset('AI/ML', 9)
+
+    assert cache.get(['category'])['category']['AI/ML'] == 5
+    assert db.loads == 1
+
+
+def test_write_racing_a_load_discards_the_snapshot(monkeypatch):
+    FakeClock(monkeypatch)
+    db = FakeDB(ROWS)
+    cache = FacetCache(db, ttl=60)
+    db.during_load = lambda: cache.add_dataset('AI/ML', 9)
+
+    # The caller still gets the loaded counts...
+    assert cache.get(['category'])['category']['AI/ML'] == 5
+    # ...but they aren't cached, since the racing write may be missing from them
+    assert cache.counts is None
+
+    cache.get(['category'])
+    assert db.loads == 2
+    assert cache.counts is not None
+
+
+def test_cache_expires_after_ttl(monkeypatch):
+    clock = FakeClock(monkeypatch)
+    db = FakeDB(ROWS)
+    cache = FacetCache(db, ttl=60)
+
+    cache.get(['category'])
+    clock.now += 59
+    cache.get(['category'])
+    assert db.loads == 1
+
+    # A write made outside the API shows up after the TTL
+    db.rows = ROWS + [{'facet': 'category', 'value': 'Health', 'count': 1}]
+    clock.now += 2
+    assert cache.get(['category'])['category']['Health'] == 1
+    assert db.loads == 2
@@ -0,0 +1,183 @@
+"""
+Tests for the binary shard writer and reader
+Uses a fake database, so no PostgreSQL is needed
+"""
+import datetime
+import pickle
+
+import pytest
+
+from shards import ShardReader, ShardWriter
+from shards.format import shard_paths
+
+
+class FakeDB:
+    """Stands in for DatabaseManager.get_datasets_after"""
+
+    def __init__(self, count=0):
+        self.rows = []
+        self.add(count)
+
+    def add(self, count):
+        """Add datasets with the next ids"""
+        start = len(self.rows) + 1
+        for dataset_id in range(start, start + count):
+            self.rows.append({
+                'id': dataset_id,
+                'content': f"Dataset number {dataset_id} ünïcode",
+                'source': 'Wikipedia',
+                'category': 'AI/ML' if dataset_id % 2 else 'Science',
+                'quality_score': dataset_id % 10 + 1,
+                'word_count': 4,
+                'created_at': datetime.datetime(2024, 1, 1),
+                'tags': ['python'] if dataset_id % 3 == 0 else [],
+            })
+
+    def get_datasets_after(self, last_id, limit, settle_seconds=0):
+        return [row for row in self.rows if row['id'] > last_id][:limit]
+
+
+def write(db, directory, **kwargs):
+    """Run one incremental writer pass"""
+    kwargs.setdefault('shard_size', 400)
+    kwargs.setdefault('batch_size', 7)
+    return ShardWriter(db, str(directory), **kwargs).write()
+
+
+def test_round_trip(tmp_path):
+    db = FakeDB(20)
+    assert write(db, tmp_path) == 20
+
+    with ShardReader(str(tmp_path)) as reader:
+        assert len(reader) == 20
+        for position, row in enumerate(db.rows):
+            record = reader[position]
+            assert record['id'] == row['id']
+            assert record['content'] == row['content']
+            assert record['category'] == row['category']
+            assert record['tags'] == row['tags']
+            assert record['created_at'] == '2024-01-01T00:00:00'
+        assert reader[-1]['id'] == 20
+
+
+def test_small_shard_size_splits_into_many_shards(tmp_path):
+    db = FakeDB(30)
+    writer = ShardWriter(db, str(tmp_path), shard_size=400, batch_size=7)
+    writer.write()
+
+    assert len(writer.manifest['shards']) > 1
+    for shard in writer.manifest['shards']:
+        # A shard only goes over the limit when a single record is bigger
+        assert shard['bytes'] <= 400 or shard['records'] == 1
+
+
+def test_incremental_append_only_writes_new_ids(tmp_path):
+    db = FakeDB(15)
+    assert write(db, tmp_path) == 15
+    assert write(db, tmp_path) == 0
+
+    db.add(10)
+    assert write(db, tmp_path) == 10
+
+    with ShardReader(str(tmp_path)) as reader:
+        assert [reader[i]['id'] for i in range(len(reader))] == list(range(1, 26))
+
+
+def test_uncommitted_tail_is_discarded(tmp_path):
+    db = FakeDB(10)
+    writer = ShardWriter(db, str(tmp_path), shard_size=400, batch_size=7)
+    writer.write()
+
+    # Simulate a run that wrote bytes but crashed before saving the manifest
+    last = writer.manifest['shards'][-1]
+    bin_path, idx_path = shard_paths(str(tmp_path), last['number'])
+    with open(bin_path, 'ab') as f:
+        f.write(b'garbage' * 10)
+    with open(idx_path, 'ab') as f:
+        f.write(b'\xff' * 16)
+
+    db.add(5)
+    assert write(db, tmp_path) == 5
+
+    with ShardReader(str(tmp_path)) as reader:
+        assert [reader[i]['id'] for i in range(len(reader))] == list(range(1, 16))
+
+
+def test_get_by_id(tmp_path):
+    db = FakeDB(25)
+    write(db, tmp_path)
+
+    with ShardReader(str(tmp_path)) as reader:
+        for dataset_id in (1, 9, 17, 25):
+            assert reader.get_by_id(dataset_id)['id'] == dataset_id
+        assert reader.get_by_id(0) is None
+        assert reader.get_by_id(26) is None
+
+
+def test_index_out_of_range(tmp_path):
+    write(FakeDB(3), tmp_path)
+
+    with ShardReader(str(tmp_path)) as reader:
+        with pytest.raises(IndexError):
+            reader[3]
+
+
+def test_workers_split_positions_without_overlap(tmp_path):
+    write(FakeDB(23), tmp_path)
+
+    with ShardReader(str(tmp_path)) as reader:
+        splits = [
+            reader.positions(shuffle=True, seed=7, epoch=2, worker_id=worker, num_workers=3)
+            for worker in range(3)
+        ]
+        combined = [position for split in splits for position in split]
+        assert sorted(combined) == list(range(23))
+
+        # Same seed and epoch give the same order, a new epoch reshuffles
+        assert reader.positions(shuffle=True, seed=7, epoch=2) == \
+            reader.positions(shuffle=True, seed=7, epoch=2)
+        assert reader.positions(shuffle=True, seed=7, epoch=2) != \
+            reader.positions(shuffle=True, seed=7, epoch=3)
+
+        with pytest.raises(ValueError):
+            reader.positions(worker_id=3, num_workers=3)
+
+
+def test_reader_can_be_pickled_for_worker_processes(tmp_path):
+    write(FakeDB(12), tmp_path)
+
+    with ShardReader(str(tmp_path)) as reader:
+        copy = pickle.loads(pickle.dumps(reader))
+        assert len(copy) == 12
+        assert copy[5] == reader[5]
+        copy.close()
+
+
+def test_missing_manifest(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        ShardReader(str(tmp_path))
+
+
+def test_pickled_reader_keeps_the_parent_snapshot(tmp_path):
+    db = FakeDB(10)
+    write(db, tmp_path)
+
+    with ShardReader(str(tmp_path)) as reader:
+        state = pickle.dumps(reader)
+
+        # The writer appends after the parent opened but before workers start
+        db.add(5)
+        write(db, tmp_path)
+
+        workers = [pickle.loads(state) for _ in range(2)]
+        assert [len(worker) for worker in workers] == [10, 10]
+
+        splits = [
+            worker.positions(shuffle=True, seed=1, epoch=0, worker_id=number, num_workers=2)
+            for number, worker in enumerate(workers)
+        ]
+        assert sorted(splits[0] + splits[1]) == list(range(10))
+        assert [workers[0][i]['id'] for i in range(10)] == list(range(1, 11))
+
+        for worker in workers:
+            worker.close()